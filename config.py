@@ -38,3 +38,32 @@ DB_CONFIG = {
 # 5. Channel Configuration
 # Enforce 14 channels for consistency
 EXPECTED_CHANNELS = 14
+
+# 6. Epoch Quality Gate
+# Applied to the (n_epochs, channels, samples) tensor of recorded samples (source rate, before any filtering).
+# An epoch is rejected if ANY channel fails ANY check.
+# PTP / variance thresholds refer to the linearly detrended epoch (DC offset and drift removed).
+QC_ENABLED = True
+QC_MODE = "flag"             # "flag": keep all epochs, store bitmask in qc_flags (reproduces docs/results.md) | "drop": discard bad epochs
+QC_MAX_PTP = 500.0           # Max peak-to-peak amplitude per channel (uV) - saturation / electrode pop
+QC_MIN_VARIANCE = 0.01       # Min variance per channel (uV^2) - dead / disconnected channel
+QC_MAX_FLAT_SEC = 0.5        # Max run of identical consecutive samples (seconds) - flatline / clipping
+QC_LINE_FREQS = (50, 60)     # Mains frequencies to check (Hz)
+QC_LINE_BW = 1.0             # Half-width of the mains band (Hz)
+QC_MAX_LINE_RATIO = 0.5      # Max fraction of channel power inside the mains bands
+QC_EXCLUDE_FLAGGED = False   # Training (and its subject stats) use only rows with qc_flags = 0
+
+# 7. Resampling (sources not recorded at FS, e.g. raw DEAP @ 512Hz)
+# The 0.5-40 Hz bandpass is fused into the polyphase decimation filter.
+RESAMPLE_TRANS_BW = 0.5      # FIR transition width (Hz) - sets the number of taps
+RESAMPLE_CHUNK_SEC = 120     # Process long recordings in chunks of this many seconds (None = whole file)
+KNOWN_FS = (128, 250, 256, 500, 512, 1000, 1024, 2048)  # Rates a source may be inferred as (Hz)
+DEAP_TRIAL_SECS = (63, 60)   # DEAP trial lengths (3s baseline + 60s, or baseline removed)
+FS_MATCH_TOL = 0.005         # Max relative mismatch between trial length and a known rate
+
+# 8. Per-Subject Normalization
+# Running per-subject, per-feature stats (count, mean, M2) are kept in
+# 'subject_feature_stats' by the ETL; training can z-score via a lookup join.
+NORM_LOG_DOMAIN = True       # Z-score log10(band power) instead of raw power (ETL keeps stats for both)
+NORM_LOG_EPS = 1e-12         # Floor added before log10
+SUBJECT_NORMALIZATION = False  # Apply per-subject z-scoring in train_model.prepare_data
@@ -13,6 +13,12 @@ def get_db_connection():
         print(f"Error connecting to MySQL: {err}")
         raise
 
+# Columns added after the first release: (name, definition) for ALTER TABLE
+MIGRATED_COLUMNS = [
+    ("subject_key", "VARCHAR(100) AFTER subject_id"),
+    ("qc_flags", "INT DEFAULT 0 AFTER label")
+]
+
 def create_table_if_not_exists(feature_names):
     """
     Creates the 'eeg_features' table if it doesn't exist.
@@ -26,7 +32,9 @@ def create_table_if_not_exists(feature_names):
         "id INT AUTO_INCREMENT PRIMARY KEY",
         "dataset_name VARCHAR(50)",
         "subject_id VARCHAR(100)",
+        "subject_key VARCHAR(100)",  # Recording subject (source file) - normalization key
         "label INT",  # 0: Focused, 1: Unfocused, 2: Drowsy
+        "qc_flags INT DEFAULT 0",  # Quality gate bitmask (see etl/quality.py)
         "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
     ]
 
@@ -43,6 +51,20 @@ def create_table_if_not_exists(feature_names):
     
     try:
         cursor.execute(create_stmt)
+        # Migrate tables created before these columns existed
+        for col, definition in MIGRATED_COLUMNS:
+            cursor.execute(f"SHOW COLUMNS FROM eeg_features LIKE '{col}'")
+            if not cursor.fetchall():
+                cursor.execute(f"ALTER TABLE eeg_features ADD COLUMN `{col}` {definition}")
+                print(f"Added missing '{col}' column to 'eeg_features'.")
+        # Backfill subject_key for rows ingested before it existed (DEAP subject_id = '<file>_t<trial>')
+        cursor.execute("""
+        UPDATE eeg_features
+        SET subject_key = IF(dataset_name = 'DEAP', SUBSTRING_INDEX(subject_id, '_t', 1), subject_id)
+        WHERE subject_key IS NULL
+        """)
+        if cursor.rowcount > 0:
+            print(f"Backfilled 'subject_key' for {cursor.rowcount} rows.")
         conn.commit()
         print("Table 'eeg_features' checked/created successfully.")
     except mysql.connector.Error as err:
@@ -50,3 +72,115 @@ def create_table_if_not_exists(feature_names):
     finally:
         cursor.close()
         conn.close()
+
+def create_quality_table_if_not_exists():
+    """
+    Creates the 'etl_quality_log' table if it doesn't exist.
+    One row per processed file with per-reason epoch rejection counts.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    create_stmt = """
+    CREATE TABLE IF NOT EXISTS etl_quality_log (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        dataset_name VARCHAR(50),
+        file_name VARCHAR(255),
+        n_epochs INT,
+        n_rejected INT,
+        n_ptp INT,
+        n_low_var INT,
+        n_flatline INT,
+        n_line_noise INT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+
+    try:
+        cursor.execute(create_stmt)
+        conn.commit()
+        print("Table 'etl_quality_log' checked/created successfully.")
+    except mysql.connector.Error as err:
+        print(f"Error creating table: {err}")
+    finally:
+        cursor.close()
+        conn.close()
+
+def insert_quality_log(cursor, dataset_name, file_name, counts):
+    """Inserts one file's quality gate counts (from etl.quality.rejection_counts)."""
+    cols = ["n_epochs", "n_rejected", "n_ptp", "n_low_var", "n_flatline", "n_line_noise"]
+    sql = f"""
+    INSERT INTO etl_quality_log (dataset_name, file_name, {', '.join(cols)})
+    VALUES ({', '.join(['%s'] * (len(cols) + 2))})
+    """
+    cursor.execute(sql, (dataset_name, file_name, *(counts[c] for c in cols)))
+
+def is_file_ingested(cursor, dataset_name, file_name):
+    """
+    True if a file was already loaded: it has a quality log row (written in the
+    same transaction as its features) or, for rows from before the log
+    existed, feature rows under its subject_key. Guards against appending a
+    file's rows - and its subject stats - twice.
+    """
+    cursor.execute(
+        "SELECT 1 FROM etl_quality_log WHERE dataset_name = %s AND file_name = %s LIMIT 1",
+        (dataset_name, file_name)
+    )
+    if cursor.fetchall():
+        return True
+    cursor.execute(
+        "SELECT 1 FROM eeg_features WHERE dataset_name = %s AND subject_key = %s LIMIT 1",
+        (dataset_name, file_name)
+    )
+    return bool(cursor.fetchall())
+
+def create_stats_table_if_not_exists():
+    """
+    Creates the 'subject_feature_stats' table if it doesn't exist.
+    One row per (dataset, subject, feature, domain, row set) holding Welford running stats.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    create_stmt = """
+    CREATE TABLE IF NOT EXISTS subject_feature_stats (
+        dataset_name VARCHAR(50),
+        subject_key VARCHAR(100),
+        feature VARCHAR(50),
+        log_domain TINYINT,
+        qc_clean TINYINT,
+        n BIGINT,
+        mean DOUBLE,
+        m2 DOUBLE,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (dataset_name, subject_key, feature, log_domain, qc_clean)
+    );
+    """
+
+    try:
+        cursor.execute(create_stmt)
+        conn.commit()
+        print("Table 'subject_feature_stats' checked/created successfully.")
+    except mysql.connector.Error as err:
+        print(f"Error creating table: {err}")
+    finally:
+        cursor.close()
+        conn.close()
+
+def upsert_subject_stats(cursor, stat_rows):
+    """
+    Merges batch stats into 'subject_feature_stats'.
+    stat_rows: tuples of (dataset_name, subject_key, feature, log_domain, qc_clean, n, mean, m2).
+    Existing rows are combined with Chan's parallel formula inside the upsert,
+    so concurrent ETL workers merge correctly under the row lock.
+    """
+    # MySQL applies the assignments left to right: m2 and mean must read the old n/mean
+    sql = """
+    INSERT INTO subject_feature_stats (dataset_name, subject_key, feature, log_domain, qc_clean, n, mean, m2)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        m2 = m2 + VALUES(m2) + POW(VALUES(mean) - mean, 2) * n * VALUES(n) / (n + VALUES(n)),
+        mean = mean + (VALUES(mean) - mean) * VALUES(n) / (n + VALUES(n)),
+        n = n + VALUES(n)
+    """
+    cursor.executemany(sql, stat_rows)
@@ -5,7 +5,10 @@ import pickle
 from scipy.io import loadmat
 from scipy.signal import welch, butter, filtfilt
 import config
-from db_utils import get_db_connection, create_table_if_not_exists
+from db_utils import get_db_connection, create_table_if_not_exists, create_quality_table_if_not_exists, insert_quality_log, create_stats_table_if_not_exists, upsert_subject_stats, is_file_ingested
+from etl.quality import epoch_tensor, apply_quality_gate
+from etl.resample import resample_ratio, resample_bandpass
+from etl.subject_stats import batch_stats, backfill_subject_stats
 
 # --- CONFIGURATION (Frozen) ---
 FS = config.FS
@@ -49,10 +52,33 @@ def map_label(arousal_score):
     else:
         return 1 # Unfocused
 
-def extract_features_from_epoch(epoch, ch_count):
+def detect_fs(source, n_samples):
+    """
+    Source sampling rate of a DEAP file.
+    Uses an explicit rate key if present (must be one of config.KNOWN_FS,
+    otherwise None is returned), else matches the trial length (63s, or 60s
+    with baseline removed) against config.KNOWN_FS:
+    8064 samples -> 128 Hz (preprocessed), 32256 -> 512 Hz (raw).
+    Trial lengths matching no known rate fall back to FS, as before rate detection.
+    """
+    for key in ("fs", "srate", "sampling_rate"):
+        if key in source:
+            fs = float(np.squeeze(source[key]))
+            return fs if fs in config.KNOWN_FS else None
+    matches = {
+        fs for fs in config.KNOWN_FS for sec in config.DEAP_TRIAL_SECS
+        if abs(n_samples - fs * sec) <= config.FS_MATCH_TOL * fs * sec
+    }
+    if len(matches) != 1:
+        print(f"  -> Warning: {n_samples} samples per trial match no known rate. Assuming {FS} Hz.")
+        return float(FS)
+    return float(matches.pop())
+
+def extract_features_from_epoch(epoch, ch_count, filtered=False):
     feat = {}
     for ch in range(ch_count):
-        sig = bandpass(epoch[ch])
+        # Resampled sources were already bandpassed during decimation
+        sig = epoch[ch] if filtered else bandpass(epoch[ch])
         for name, band in BANDS.items():
             feat[f"ch{ch+1}_{name}"] = float(band_power(sig, band))
     return feat
@@ -72,57 +98,83 @@ def process_file(f, feature_names):
         if f.endswith('.dat'):
             with open(f, 'rb') as file:
                 # DEAP .dat (python) files are usually dictionaries
-                content = pickle.load(file, encoding='latin1')
-                data = content['data']
-                labels = content['labels']
+                source = pickle.load(file, encoding='latin1')
         else:
             # Fallback to .mat if needed
-            mat = loadmat(f)
-            if 'data' not in mat or 'labels' not in mat:
+            source = loadmat(f)
+            if 'data' not in source or 'labels' not in source:
                  print(f"Skipping {fname}: Invalid DEAP .mat format.")
-                 return []
-            data = mat['data']
-            labels = mat['labels']
+                 return [], None
+        data = source['data']
+        labels = source['labels']
         
         # data shape: trials x channels x samples
         n_trials, n_channels, n_samples_total = data.shape
         
+        fs_src = detect_fs(source, n_samples_total)
+        if fs_src is None:
+            print(f"Skipping {fname}: Sampling rate is not one of {config.KNOWN_FS}.")
+            return [], None
+        filtered = fs_src != FS
+        
         batch_data = []
         win = config.EPOCH_SAMPLES
+        win_src = int(round(EPOCH_SEC * fs_src))
+        
+        # Epochs per trial, identical at both rates (resample_poly returns ceil(n * up / down) samples)
+        up, down = resample_ratio(fs_src, FS)
+        n_samples_out = -(-n_samples_total * up // down)
+        n_per_trial = min((n_samples_total - 1) // win_src, (n_samples_out - 1) // win)
+        n_per_trial = max(0, n_per_trial)
+        trial_ids = np.repeat(np.arange(n_trials), n_per_trial)
+        
+        # 1. Epoching (whole file at once)
+        # DEAP (python) is 40 x 40 x 8064 (63s * 128Hz)
+        # Preprocessed data usually has baseline removed (3s). 
+        # If 8064, it includes 3s baseline. We might want to skip it?
+        # For now, processing uniformly.
+        # Channel Selection -> (trials * epochs_per_trial, channels, win)
+        src = data[:, :CHANNELS_TO_USE, :]
+        src_epochs = epoch_tensor(src, win_src)[:, :n_per_trial].reshape(-1, CHANNELS_TO_USE, win_src)
+        
+        # 2. Quality Gate on the recorded samples (before resampling / feature extraction)
+        keep, flags, counts = apply_quality_gate(src_epochs, fs_src)
+        print(f"  -> Quality gate: {counts['n_rejected']}/{counts['n_epochs']} epochs flagged.")
+        
+        # Raw / non-128Hz sources: one polyphase pass does resampling + 0.5-40 Hz bandpass.
+        # Epoch k covers the same time span at both rates, so the flags carry over.
+        if filtered:
+            print(f"  -> Resampling {fs_src:g} Hz -> {FS} Hz (fused bandpass).")
+            epochs = epoch_tensor(resample_bandpass(src, fs_src, FS), win)
+            epochs = epochs[:, :n_per_trial].reshape(-1, CHANNELS_TO_USE, win)
+        else:
+            epochs = src_epochs
         
-        for trial_idx in range(n_trials):
-            # 1. Get Labels
+        for i in np.flatnonzero(keep):
+            trial_idx = int(trial_ids[i])
+            # 3. Get Labels
             # labels: [valence, arousal, dominance, liking]
             arousal = labels[trial_idx, 1] 
             mapped_label = map_label(arousal)
             
-            # 2. Get Data & Channel Selection
-            trial_data = data[trial_idx, :CHANNELS_TO_USE, :] 
+            # 4. Feature Extraction
+            feats = extract_features_from_epoch(epochs[i], CHANNELS_TO_USE, filtered)
             
-            # 3. Epoching
-            # DEAP (python) is 40 x 40 x 8064 (63s * 128Hz)
-            # Preprocessed data usually has baseline removed (3s). 
-            # If 8064, it includes 3s baseline. We might want to skip it?
-            # For now, processing uniformly.
-            for start in range(0, n_samples_total - win, win):
-                epoch = trial_data[:, start:start+win]
+            row = {
+                "dataset_name": DATASET_NAME,
+                "subject_id": f"{fname}_t{trial_idx}", 
+                "subject_key": fname, # One DEAP file = one participant
+                "label": mapped_label,
+                "qc_flags": int(flags[i]),
+                **feats
+            }
+            batch_data.append(row)
                 
-                # 4. Feature Extraction
-                feats = extract_features_from_epoch(epoch, CHANNELS_TO_USE)
-                
-                row = {
-                    "dataset_name": DATASET_NAME,
-                    "subject_id": f"{fname}_t{trial_idx}", 
-                    "label": mapped_label,
-                    **feats
-                }
-                batch_data.append(row)
-                
-        return batch_data
+        return batch_data, counts
 
     except Exception as e:
         print(f"Error processing {fname}: {e}")
-        return []
+        return [], None
 
 def run_etl():
     print(f"--- Starting DEAP ETL ---")
@@ -130,6 +182,9 @@ def run_etl():
     
     feature_names = get_feature_names(CHANNELS_TO_USE)
     create_table_if_not_exists(feature_names)
+    create_quality_table_if_not_exists()
+    create_stats_table_if_not_exists()
+    backfill_subject_stats(feature_names)
     
     # Look for .dat and .mat
     files = sorted(glob.glob(os.path.join(FOLDER_PATH, "*.dat")) + glob.glob(os.path.join(FOLDER_PATH, "*.mat")))
@@ -144,25 +199,40 @@ def run_etl():
     total_inserted = 0
 
     for f in files:
-        batch_data = process_file(f, feature_names)
-        
-        if not batch_data:
+        if is_file_ingested(cursor, DATASET_NAME, os.path.basename(f)):
+            print(f"Skipping {os.path.basename(f)}: Already ingested.")
             continue
-            
-        # Bulk Insert
-        cols = ["dataset_name", "subject_id", "label"] + feature_names
-        placeholders = ", ".join(["%s"] * len(cols))
-        columns_str = ", ".join([f"`{c}`" for c in cols])
-        sql = f"INSERT INTO eeg_features ({columns_str}) VALUES ({placeholders})"
         
-        val_list = []
-        for row in batch_data:
-            val_list.append(tuple(row[c] for c in cols))
+        batch_data, counts = process_file(f, feature_names)
+        
+        try:
+            if counts is not None:
+                insert_quality_log(cursor, DATASET_NAME, os.path.basename(f), counts)
             
-        cursor.executemany(sql, val_list)
-        conn.commit()
-        print(f"  -> Inserted {len(batch_data)} epochs.")
-        total_inserted += len(batch_data)
+            if not batch_data:
+                conn.commit()  # Quality log only
+                continue
+                
+            # Bulk Insert
+            cols = ["dataset_name", "subject_id", "subject_key", "label", "qc_flags"] + feature_names
+            placeholders = ", ".join(["%s"] * len(cols))
+            columns_str = ", ".join([f"`{c}`" for c in cols])
+            sql = f"INSERT INTO eeg_features ({columns_str}) VALUES ({placeholders})"
+            
+            val_list = []
+            for row in batch_data:
+                val_list.append(tuple(row[c] for c in cols))
+                
+            cursor.executemany(sql, val_list)
+            # Running per-subject stats and the quality log, committed together with the rows they describe
+            upsert_subject_stats(cursor, batch_stats(batch_data, feature_names))
+            conn.commit()
+            print(f"  -> Inserted {len(batch_data)} epochs.")
+            total_inserted += len(batch_data)
+        
+        except Exception as e:
+            conn.rollback()  # Drop this file's partial quality log / rows
+            print(f"Error inserting {os.path.basename(f)}: {e}")
 
     cursor.close()
     conn.close()
@@ -5,7 +5,9 @@ import pandas as pd
 from scipy.io import loadmat
 from scipy.signal import welch, butter, filtfilt
 import config
-from db_utils import get_db_connection, create_table_if_not_exists
+from db_utils import get_db_connection, create_table_if_not_exists, create_quality_table_if_not_exists, insert_quality_log, create_stats_table_if_not_exists, upsert_subject_stats, is_file_ingested
+from etl.quality import epoch_tensor, apply_quality_gate
+from etl.subject_stats import batch_stats, backfill_subject_stats
 
 # --- CONFIGURATION (Loaded from config.py) ---
 FS = config.FS
@@ -70,6 +72,9 @@ def run_etl():
     print("Setting up database...")
     feature_names = get_feature_names()
     create_table_if_not_exists(feature_names)
+    create_quality_table_if_not_exists()
+    create_stats_table_if_not_exists()
+    backfill_subject_stats(feature_names)
 
     # 2. Process Files
     files = sorted(glob.glob("*.mat"))
@@ -82,6 +87,9 @@ def run_etl():
 
     for f in files:
         fname = os.path.basename(f)
+        if is_file_ingested(cursor, DATASET_NAME, fname):
+            print(f"Skipping {fname}: Already ingested.")
+            continue
         print(f"Processing {fname}...")
         
         try:
@@ -101,31 +109,46 @@ def run_etl():
             print(f"DEBUG: EEG shape: {eeg.shape}")
             print(f"DEBUG: Segments count: {len(segments)}")
             
+            epoch_list = []
+            label_list = []
             for seg_data, label in segments:
                 n_samples_seg = seg_data.shape[1]
                 print(f"DEBUG: Seg label {label}, samples {n_samples_seg}")
 
-                n_samples = seg_data.shape[1]
                 # Epoching
-                for start in range(0, n_samples - win, win):
-                    epoch = seg_data[:, start:start+win]
-                    feats = extract_features_from_epoch(epoch, n_channels)
-                    
-                    # Prepare row for SQL
-                    row = {
-                        "dataset_name": DATASET_NAME,
-                        "subject_id": fname,
-                        "label": label,
-                        **feats # unpack feature columns
-                    }
-                    batch_data.append(row)
+                seg_epochs = epoch_tensor(seg_data, win)
+                epoch_list.append(seg_epochs)
+                label_list.append(np.full(len(seg_epochs), label))
+
+            epochs = np.concatenate(epoch_list)
+            labels = np.concatenate(label_list)
+
+            # Quality Gate (before feature extraction)
+            keep, flags, counts = apply_quality_gate(epochs)
+            print(f"  -> Quality gate: {counts['n_rejected']}/{counts['n_epochs']} epochs flagged.")
+            insert_quality_log(cursor, DATASET_NAME, fname, counts)
+
+            for i in np.flatnonzero(keep):
+                feats = extract_features_from_epoch(epochs[i], n_channels)
+                
+                # Prepare row for SQL
+                row = {
+                    "dataset_name": DATASET_NAME,
+                    "subject_id": fname,
+                    "subject_key": fname,
+                    "label": int(labels[i]),
+                    "qc_flags": int(flags[i]),
+                    **feats # unpack feature columns
+                }
+                batch_data.append(row)
             
             if not batch_data:
+                conn.commit()  # Quality log only
                 continue
 
             # 3. Bulk Insert
             # Construct INSERT statement dynamically
-            cols = ["dataset_name", "subject_id", "label"] + feature_names
+            cols = ["dataset_name", "subject_id", "subject_key", "label", "qc_flags"] + feature_names
             placeholders = ", ".join(["%s"] * len(cols))
             columns_str = ", ".join([f"`{c}`" for c in cols])
             
@@ -137,11 +160,14 @@ def run_etl():
                 val_list.append(tuple(row[c] for c in cols))
 
             cursor.executemany(sql, val_list)
+            # Running per-subject stats and the quality log, committed together with the rows they describe
+            upsert_subject_stats(cursor, batch_stats(batch_data, feature_names))
             conn.commit()
             print(f"  -> Inserted {len(batch_data)} epochs.")
             total_inserted += len(batch_data)
 
         except Exception as e:
+            conn.rollback()  # Drop this file's partial quality log / rows
             print(f"Error processing {fname}: {e}")
 
     cursor.close()
@@ -0,0 +1,99 @@
+import numpy as np
+from scipy.signal import detrend
+import config
+
+# --- CONFIGURATION (Loaded from config.py) ---
+FS = config.FS
+
+# Rejection reasons (bitmask, stored in eeg_features.qc_flags when QC_MODE = "flag")
+QC_PTP = 1          # Peak-to-peak above QC_MAX_PTP
+QC_LOW_VAR = 2      # Variance below QC_MIN_VARIANCE
+QC_FLATLINE = 4     # Flat run longer than QC_MAX_FLAT_SEC
+QC_LINE_NOISE = 8   # Mains power ratio above QC_MAX_LINE_RATIO
+
+QC_REASONS = {
+    "ptp": QC_PTP,
+    "low_var": QC_LOW_VAR,
+    "flatline": QC_FLATLINE,
+    "line_noise": QC_LINE_NOISE
+}
+
+# --- FUNCTIONS ---
+
+def epoch_tensor(x, win):
+    """
+    Slices a (..., channels, samples) array into non-overlapping epochs.
+    Returns a (..., n_epochs, channels, win) array, matching range(0, samples - win, win).
+    """
+    n_epochs = max(0, (x.shape[-1] - 1) // win)
+    x = x[..., :n_epochs * win]
+    x = x.reshape(*x.shape[:-1], n_epochs, win)
+    return np.swapaxes(x, -2, -3)
+
+def longest_flat_run(epochs):
+    """Longest run of identical consecutive samples per channel -> (n_epochs, channels)."""
+    same = np.diff(epochs, axis=-1) == 0
+    run = np.cumsum(same, axis=-1)
+    # Subtract the cumulative count at the last break to restart the run
+    resets = np.maximum.accumulate(np.where(same, 0, run), axis=-1)
+    return (run - resets).max(axis=-1, initial=0) + 1
+
+def line_noise_ratio(epochs, fs=FS):
+    """Fraction of each channel's power inside the mains bands -> (n_epochs, channels)."""
+    n = epochs.shape[-1]
+    spec = np.abs(np.fft.rfft(epochs - epochs.mean(axis=-1, keepdims=True), axis=-1)) ** 2
+    freqs = np.fft.rfftfreq(n, 1 / fs)
+    line = np.zeros(freqs.shape, dtype=bool)
+    for f0 in config.QC_LINE_FREQS:
+        line |= np.abs(freqs - f0) <= config.QC_LINE_BW
+    total = spec.sum(axis=-1)
+    return spec[..., line].sum(axis=-1) / np.maximum(total, np.finfo(float).tiny)
+
+def quality_flags(epochs, fs=FS):
+    """
+    Runs the quality gate over a (n_epochs, channels, samples) tensor of
+    recorded (unfiltered) samples at rate fs.
+    Returns an int bitmask per epoch (0 = clean). An epoch fails a check
+    if any of its channels does.
+
+    Peak-to-peak and variance are measured on the linearly detrended epoch,
+    so DC offset and slow drift (removed later by the bandpass) don't count.
+    Flatline runs and line noise are measured on the samples as recorded.
+    """
+    epochs = np.asarray(epochs, dtype=float)
+    flags = np.zeros(epochs.shape[0], dtype=int)
+    if epochs.shape[0] == 0:
+        return flags
+
+    max_flat = int(config.QC_MAX_FLAT_SEC * fs)
+    detrended = detrend(epochs, axis=-1, type="linear")
+
+    flags[(np.ptp(detrended, axis=-1) > config.QC_MAX_PTP).any(axis=1)] |= QC_PTP
+    flags[(detrended.var(axis=-1) < config.QC_MIN_VARIANCE).any(axis=1)] |= QC_LOW_VAR
+    flags[(longest_flat_run(epochs) > max_flat).any(axis=1)] |= QC_FLATLINE
+    flags[(line_noise_ratio(epochs, fs) > config.QC_MAX_LINE_RATIO).any(axis=1)] |= QC_LINE_NOISE
+    return flags
+
+def rejection_counts(flags):
+    """Summarises a flags array into per-reason counts for the quality log."""
+    counts = {"n_epochs": int(len(flags)), "n_rejected": int(np.count_nonzero(flags))}
+    for name, bit in QC_REASONS.items():
+        counts[f"n_{name}"] = int(np.count_nonzero(flags & bit))
+    return counts
+
+def apply_quality_gate(epochs, fs=FS):
+    """
+    Applies the configured gate to an epoch tensor recorded at rate fs.
+    Returns (keep_mask, flags, counts). In "drop" mode keep_mask excludes
+    flagged epochs; in "flag" mode every epoch is kept and flags are passed on.
+    """
+    if not config.QC_ENABLED:
+        flags = np.zeros(len(epochs), dtype=int)
+    else:
+        flags = quality_flags(epochs, fs)
+
+    if config.QC_MODE == "drop":
+        keep = flags == 0
+    else:
+        keep = np.ones(len(flags), dtype=bool)
+    return keep, flags, rejection_counts(flags)
@@ -0,0 +1,69 @@
+from fractions import Fraction
+import numpy as np
+from scipy.signal import firwin, resample_poly
+import config
+
+# --- CONFIGURATION (Loaded from config.py) ---
+FS = config.FS
+
+# --- FUNCTIONS ---
+
+def resample_ratio(fs_src, fs_dst=FS):
+    """Smallest integer (up, down) pair with fs_src * up / down == fs_dst."""
+    ratio = Fraction(fs_dst).limit_denominator(10000) / Fraction(fs_src).limit_denominator(10000)
+    return ratio.numerator, ratio.denominator
+
+def design_fused_filter(fs_src, up, low=0.5, high=40, trans_bw=None):
+    """
+    Linear-phase FIR bandpass designed at the upsampled rate (fs_src * up).
+    'high' sits below the target Nyquist, so the same taps act as the
+    anti-aliasing filter for the decimation.
+    """
+    trans_bw = trans_bw or config.RESAMPLE_TRANS_BW
+    fs_up = fs_src * up
+    numtaps = int(np.ceil(3.3 * fs_up / trans_bw)) | 1  # Hamming rule of thumb, odd length
+    return firwin(numtaps, [low, high], pass_zero=False, fs=fs_up)
+
+def resample_bandpass(x, fs_src, fs_dst=FS, low=0.5, high=40, chunk_sec=None):
+    """
+    Converts x (..., samples) from fs_src to fs_dst with a single polyphase
+    pass (resample_poly) whose FIR is the 0.5-40 Hz bandpass.
+    All leading axes (trials, channels) are filtered in one call.
+
+    chunk_sec splits long recordings along time; chunks overlap by the
+    filter half-length so the output matches the unchunked result.
+    """
+    up, down = resample_ratio(fs_src, fs_dst)
+    h = design_fused_filter(fs_src, up, low, high)
+    n = x.shape[-1]
+
+    # resample_poly zero-pads the edges: each channel's offset and linear drift
+    # (both rejected by the bandpass) are subtracted so raw DC doesn't ring into
+    # the first/last epoch. The line is fitted once over the whole recording
+    # (two reductions, no copy) and removed chunk by chunk.
+    t = np.arange(n) - (n - 1) / 2
+    offset = x.mean(axis=-1, keepdims=True)
+    slope = (x @ t)[..., None] / (np.dot(t, t) or 1.0)
+
+    chunk_sec = config.RESAMPLE_CHUNK_SEC if chunk_sec is None else chunk_sec
+    if not chunk_sec or n <= chunk_sec * fs_src:
+        step, pad = max(n, 1), 0
+    else:
+        # Chunk boundaries/padding are multiples of 'down' so each chunk maps to whole output samples
+        step = max(down, int(chunk_sec * fs_src) // down * down)
+        half_len = (len(h) - 1) // 2
+        pad = int(np.ceil((half_len / up + 1) / down)) * down
+
+    n_out = -(-n * up // down)  # resample_poly output length
+    out = np.empty(x.shape[:-1] + (n_out,))
+    for start in range(0, n, step):
+        stop = min(start + step, n)
+        lo = start - min(pad, start)
+        hi = stop + min(pad, n - stop)
+        seg = x[..., lo:hi] - (offset + slope * t[lo:hi])
+        y = resample_poly(seg, up, down, axis=-1, window=h)
+        skip = (start - lo) * up // down
+        o_start = start * up // down
+        o_stop = n_out if stop == n else stop * up // down
+        out[..., o_start:o_stop] = y[..., skip:skip + o_stop - o_start]
+    return out
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import config
+from db_utils import get_db_connection, upsert_subject_stats
+
+# --- FUNCTIONS ---
+
+def to_stats_domain(x, log_domain=None):
+    """Maps raw band powers into the domain the stats are kept in."""
+    log_domain = config.NORM_LOG_DOMAIN if log_domain is None else log_domain
+    if log_domain:
+        return np.log10(np.maximum(x, 0) + config.NORM_LOG_EPS)
+    return x
+
+def batch_stats(batch_data, feature_names):
+    """
+    Per-subject (count, mean, M2) for one file's batch of rows.
+    Stats are kept in both domains (raw and log10) and both over all rows and
+    over clean rows only (qc_flags = 0), so config.NORM_LOG_DOMAIN and
+    config.QC_EXCLUDE_FLAGGED can be switched without re-ingesting.
+    Returns tuples ready for db_utils.upsert_subject_stats, which merges
+    them into the running totals.
+    """
+    raw = pd.DataFrame(batch_data, columns=["dataset_name", "subject_key", "qc_flags"] + feature_names)
+
+    rows = []
+    for log_domain in (0, 1):
+        df = raw.copy()
+        df[feature_names] = to_stats_domain(raw[feature_names].to_numpy(dtype=float), log_domain)
+
+        for qc_clean, subset in ((0, df), (1, df[df["qc_flags"] == 0])):
+            grouped = subset.groupby(["dataset_name", "subject_key"])[feature_names]
+            n = grouped.count()
+            mean = grouped.mean()
+            m2 = grouped.var(ddof=0) * n
+
+            stats = pd.concat({"n": n.stack(), "mean": mean.stack(), "m2": m2.stack()}, axis=1).reset_index()
+            rows += [
+                (ds, subj, feat, log_domain, qc_clean, int(cnt), float(mu), float(ss))
+                for ds, subj, feat, cnt, mu, ss in stats.itertuples(index=False, name=None)
+            ]
+    return rows
+
+def backfill_subject_stats(feature_names):
+    """
+    Builds stats for subjects that have rows in eeg_features but none in
+    subject_feature_stats (rows ingested before the stats table existed).
+    Only those subjects are read, so this is a no-op once every subject is covered.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("""
+    SELECT DISTINCT f.dataset_name, f.subject_key FROM eeg_features f
+    LEFT JOIN subject_feature_stats s
+        ON s.dataset_name = f.dataset_name AND s.subject_key = f.subject_key
+    WHERE s.subject_key IS NULL AND f.subject_key IS NOT NULL
+    """)
+    missing = cursor.fetchall()
+    if missing:
+        print(f"Backfilling subject stats for {len(missing)} subjects...")
+
+    cols = ["dataset_name", "subject_key", "qc_flags"] + feature_names
+    columns_str = ", ".join([f"`{c}`" for c in cols])
+    for dataset_name, subject_key in missing:
+        cursor.execute(
+            f"SELECT {columns_str} FROM eeg_features WHERE dataset_name = %s AND subject_key = %s",
+            (dataset_name, subject_key)
+        )
+        batch = pd.DataFrame(cursor.fetchall(), columns=cols)
+        upsert_subject_stats(cursor, batch_stats(batch, feature_names))
+        conn.commit()
+
+    cursor.close()
+    conn.close()
@@ -3,7 +3,9 @@ CREATE TABLE IF NOT EXISTS eeg_features (
     id INT AUTO_INCREMENT PRIMARY KEY,
     dataset_name VARCHAR(50),
     subject_id VARCHAR(100),
+    subject_key VARCHAR(100),  -- Recording subject (source file), used for per-subject normalization
     label INT,  -- 0: Focused, 1: Unfocused, 2: Drowsy
+    qc_flags INT DEFAULT 0,  -- Quality gate bitmask (0 = clean)
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     
     -- Feature Columns (Band Powers)
@@ -22,3 +24,31 @@ CREATE TABLE IF NOT EXISTS eeg_features (
     ch13_delta FLOAT, ch13_theta FLOAT, ch13_alpha FLOAT, ch13_beta FLOAT,
     ch14_delta FLOAT, ch14_theta FLOAT, ch14_alpha FLOAT, ch14_beta FLOAT
 );
+
+-- Per-file Quality Gate Log (epoch rejection counts)
+CREATE TABLE IF NOT EXISTS etl_quality_log (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    dataset_name VARCHAR(50),
+    file_name VARCHAR(255),
+    n_epochs INT,
+    n_rejected INT,
+    n_ptp INT,
+    n_low_var INT,
+    n_flatline INT,
+    n_line_noise INT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Per-Subject Running Feature Statistics (Welford / Chan merge, maintained by ETL)
+CREATE TABLE IF NOT EXISTS subject_feature_stats (
+    dataset_name VARCHAR(50),
+    subject_key VARCHAR(100),  -- Matches eeg_features.subject_key
+    feature VARCHAR(50),
+    log_domain TINYINT,  -- 1: stats of log10(feature)
+    qc_clean TINYINT,  -- 1: stats over rows with qc_flags = 0 only
+    n BIGINT,
+    mean DOUBLE,
+    m2 DOUBLE,  -- Sum of squared deviations (variance = m2 / n)
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (dataset_name, subject_key, feature, log_domain, qc_clean)
+);
@@ -4,6 +4,7 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import GroupKFold
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix, f1_score
 from db_utils import get_db_connection
+from etl.subject_stats import to_stats_domain
 import config
 
 def load_data_from_db(datasets=["EMOTIV"]):
@@ -13,6 +14,8 @@ def load_data_from_db(datasets=["EMOTIV"]):
     # Construct comma-separated string for SQL IN clause
     datasets_str = "', '".join(datasets)
     query = f"SELECT * FROM eeg_features WHERE dataset_name IN ('{datasets_str}')"
+    if config.QC_EXCLUDE_FLAGGED:
+        query += " AND qc_flags = 0"
     
     df = pd.read_sql(query, conn)
     conn.close()
@@ -25,11 +28,61 @@ def load_data_from_db(datasets=["EMOTIV"]):
     print(f"Class distribution: {df['label'].value_counts().to_dict()}")
     return df
 
-def prepare_data(df):
+def load_subject_stats(datasets=["EMOTIV"]):
+    """
+    Loads per-subject feature stats maintained by the ETL.
+    Returns (mean, std) DataFrames indexed by (dataset_name, subject_key), one column per feature.
+    """
+    conn = get_db_connection()
+    
+    datasets_str = "', '".join(datasets)
+    query = f"""
+    SELECT dataset_name, subject_key, feature, n, mean, m2 FROM subject_feature_stats
+    WHERE dataset_name IN ('{datasets_str}') AND log_domain = {int(config.NORM_LOG_DOMAIN)}
+      AND qc_clean = {int(config.QC_EXCLUDE_FLAGGED)}
+    """
+    
+    stats = pd.read_sql(query, conn)
+    conn.close()
+    
+    stats["std"] = np.sqrt(stats["m2"] / stats["n"])
+    mean = stats.pivot(index=["dataset_name", "subject_key"], columns="feature", values="mean")
+    std = stats.pivot(index=["dataset_name", "subject_key"], columns="feature", values="std")
+    return mean, std
+
+def normalize_per_subject(df, X):
+    """
+    Z-scores each row with its subject's stats (lookup join, no extra pass over eeg_features).
+    Joined on subject_key (the recording subject), not the GroupKFold subject_id:
+    for DEAP, subject_id is a single trial with a constant label.
+    """
+    mean, std = load_subject_stats(df["dataset_name"].unique().tolist())
+    keys = pd.MultiIndex.from_frame(df[["dataset_name", "subject_key"]])
+    mu = mean.reindex(index=keys, columns=X.columns).to_numpy()
+    sd = std.reindex(index=keys, columns=X.columns).to_numpy()
+    
+    # Refuse to mix z-scored and raw rows (e.g. rows ingested before subject_key existed)
+    missing = np.isnan(mu).any(axis=1)
+    if missing.any():
+        subjects = df.loc[missing, "subject_key"].drop_duplicates().tolist()
+        raise ValueError(
+            f"No subject stats for {missing.sum()} samples (subject_key: {subjects[:5]}). "
+            "Run either ETL once to backfill subject_key and subject stats, or disable SUBJECT_NORMALIZATION."
+        )
+    sd = np.where(sd == 0, 1.0, sd)  # Constant feature: centred value is 0 anyway
+    
+    Z = (to_stats_domain(X.to_numpy(dtype=float)) - mu) / sd
+    return pd.DataFrame(Z, index=X.index, columns=X.columns)
+
+def prepare_data(df, normalize=None):
     # Identify feature columns (starting with 'ch')
     feature_cols = [c for c in df.columns if c.startswith("ch")]
     
     X = df[feature_cols]
+    if normalize is None:
+        normalize = config.SUBJECT_NORMALIZATION
+    if normalize:
+        X = normalize_per_subject(df, X)
     y = df["label"].astype(int)
     groups = df["subject_id"]
     